@@ -3,18 +3,31 @@ FastAPI application for fragrance scraping using crawl4ai.
 This API allows users to send URLs of fragrance pages and receive structured JSON data.
 """
 
-import json
-from typing import List, Dict, Any, Optional
-from fastapi import FastAPI, HTTPException
+import logging
+import multiprocessing
+import os
+import queue
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from logging.handlers import QueueHandler, QueueListener
+from typing import AsyncIterator, Iterable, List, Dict, Any, Optional, Tuple
+from urllib.parse import ParseResult, urlparse
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, HttpUrl
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, PrivateAttr, model_validator
 import asyncio
-from urllib.parse import urlparse, unquote
+import orjson
+from cachetools import TTLCache
 
-from crawl4ai import AsyncWebCrawler, BrowserConfig, CrawlerRunConfig, CacheMode
+from crawl4ai import AsyncWebCrawler, BrowserConfig, CrawlerRunConfig, CacheMode, CrawlResult, SemaphoreDispatcher
 from crawl4ai.extraction_strategy import JsonCssExtractionStrategy
-from crawl4ai.content_filter_strategy import PruningContentFilter
-from crawl4ai.markdown_generation_strategy import DefaultMarkdownGenerator
+
+from postprocess import parse_and_clean
+
+logger = logging.getLogger("fragcrawl")
 
 # Define the CSS schema for extraction
 css_schema = {
@@ -137,25 +150,216 @@ css_schema = {
 # Create the extraction strategy
 css_strategy = JsonCssExtractionStrategy(schema=css_schema)
 
+# Crawler run settings shared by every request
+_SHARED_RUN_CONFIG = CrawlerRunConfig(
+    cache_mode=CacheMode.ENABLED,
+    extraction_strategy=css_strategy
+)
+
+# Same settings, but always fetch the page instead of reading the cache
+_REFRESH_RUN_CONFIG = _SHARED_RUN_CONFIG.clone(cache_mode=CacheMode.BYPASS)
+
+# Post-processed results of recent URLs, keyed by the URL string
+_RESULT_CACHE: TTLCache = TTLCache(
+    maxsize=int(os.getenv("FRAGCRAWL_RESULT_CACHE_SIZE", "1024")),
+    ttl=int(os.getenv("FRAGCRAWL_RESULT_CACHE_TTL", "3600"))
+)
+
+# Extracted payloads larger than this are parsed in a worker process
+_OFFLOAD_THRESHOLD = 64_000
+
+# Limit the number of pages crawled at the same time, across all requests
+_CONCURRENCY = int(os.getenv("FRAGCRAWL_CONCURRENCY", "10"))
+_CRAWL_SEM = asyncio.Semaphore(_CONCURRENCY)
+
+# Batches take their share of _CRAWL_SEM one at a time, so two of them cannot deadlock
+_CRAWL_BATCH_LOCK = asyncio.Lock()
+
+# Configure browser settings for Docker environment
+browser_options: Dict[str, Any] = {
+    "headless": True,
+    "verbose": False,
+    "extra_args": ["--no-sandbox", "--disable-dev-shm-usage", "--disable-gpu"],
+}
+
+# Skip ads and stylesheets, the CSS schema does not need them.
+# Set FRAGCRAWL_BLOCK_RESOURCES=false for crawl4ai versions without these options.
+if os.getenv("FRAGCRAWL_BLOCK_RESOURCES", "true").lower() == "true":
+    browser_options.update(avoid_ads=True, avoid_css=True)
+
+browser_config = BrowserConfig(**browser_options)
+
+class CrawlerPool:
+    """
+    Long-lived AsyncWebCrawler shared across requests.
+    The browser is replaced after max_usage requests to keep its memory in check;
+    a retired browser is closed once the last request using it has finished.
+    """
+
+    def __init__(self, config: BrowserConfig, max_usage: int):
+        self.config = config
+        self.max_usage = max_usage
+        self._crawler: Optional[AsyncWebCrawler] = None
+        self._usage = 0
+        self._refs: Dict[AsyncWebCrawler, int] = {}
+        self._lock = asyncio.Lock()
+
+    async def start(self) -> None:
+        """Launch a fresh browser and make it the current crawler"""
+        crawler = AsyncWebCrawler(config=self.config)
+        await crawler.__aenter__()
+        self._crawler = crawler
+        self._usage = 0
+        self._refs[crawler] = 0
+
+    async def close(self) -> None:
+        """Close the current browser and any retired ones still open"""
+        for crawler in list(self._refs):
+            await crawler.__aexit__(None, None, None)
+        self._refs.clear()
+        self._crawler = None
+
+    async def _release(self, crawler: AsyncWebCrawler) -> None:
+        """Close a crawler if it has been retired and nobody is using it"""
+        if crawler is not self._crawler and self._refs.get(crawler) == 0:
+            del self._refs[crawler]
+            await crawler.__aexit__(None, None, None)
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[AsyncWebCrawler]:
+        """Borrow the current crawler for the duration of one request"""
+        async with self._lock:
+            if self._crawler is None or self._usage >= self.max_usage:
+                retired = self._crawler
+                await self.start()
+                if retired is not None:
+                    await self._release(retired)
+            crawler = self._crawler
+            self._usage += 1
+            self._refs[crawler] += 1
+
+        try:
+            yield crawler
+        finally:
+            self._refs[crawler] -= 1
+            await self._release(crawler)
+
+def start_log_listener() -> QueueListener:
+    """
+    Send fragcrawl log records through a queue to a background thread,
+    so writing them to stderr never blocks the event loop
+    """
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter("%(levelname)s:     %(name)s - %(message)s"))
+
+    logger.addHandler(QueueHandler(log_queue))
+    logger.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    logger.propagate = False
+
+    listener = QueueListener(log_queue, stream_handler)
+    listener.start()
+    return listener
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start the shared browser, process pool and log listener on startup and close them on shutdown"""
+    log_listener = start_log_listener()
+    app.state.crawler_pool = CrawlerPool(
+        browser_config,
+        max_usage=int(os.getenv("CRAWL4AI_BROWSER_MAX_USAGE", "100"))
+    )
+    # Worker processes are spawned on first use; spawn avoids forking the browser's threads
+    app.state.process_pool = ProcessPoolExecutor(
+        max_workers=os.cpu_count(),
+        mp_context=multiprocessing.get_context("spawn")
+    )
+    try:
+        await app.state.crawler_pool.start()
+        yield
+    finally:
+        await app.state.crawler_pool.close()
+        # Don't block the event loop waiting for the workers to exit
+        app.state.process_pool.shutdown(wait=False, cancel_futures=True)
+        log_listener.stop()
+        for handler in logger.handlers[:]:
+            if isinstance(handler, QueueHandler):
+                logger.removeHandler(handler)
+
+@asynccontextmanager
+async def crawl_slots(count: int) -> AsyncIterator[int]:
+    """
+    Hold up to count slots of the shared page limit for one batch crawl
+    and yield how many were taken
+    """
+    count = min(count, _CONCURRENCY)
+    taken = 0
+    try:
+        async with _CRAWL_BATCH_LOCK:
+            for _ in range(count):
+                await _CRAWL_SEM.acquire()
+                taken += 1
+        yield taken
+    finally:
+        for _ in range(taken):
+            _CRAWL_SEM.release()
+
+class NonStreamingGZipMiddleware(GZipMiddleware):
+    """
+    GZip middleware that leaves the /stream endpoints alone,
+    so their lines are not held back in the compressor
+    """
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "http" and scope["path"].endswith("/stream"):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
 # Create the FastAPI app
 app = FastAPI(
     title="Fragrance Scraper API",
     description="API for scraping fragrance data from Fragrantica",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # Allow all origins
-    allow_credentials=True,
-    allow_methods=["*"],  # Allow all methods
-    allow_headers=["*"],  # Allow all headers
+    allow_origins=[origin.strip() for origin in os.getenv("CORS_ORIGINS", "*").split(",") if origin.strip()],  # Comma-separated, all origins by default
+    allow_credentials=False,  # The API does not use cookies
+    allow_methods=["GET", "POST"],
+    allow_headers=["Content-Type"],
 )
 
+# Compress larger responses
+app.add_middleware(NonStreamingGZipMiddleware, minimum_size=1024)
+
 # Define the request model
 class ScrapeRequest(BaseModel):
-    urls: List[HttpUrl]
+    urls: List[str]
+    force_refresh: bool = False
+
+    _parsed_urls: List[Tuple[str, ParseResult]] = PrivateAttr(default_factory=list)
+
+    @model_validator(mode="after")
+    def parse_urls(self) -> "ScrapeRequest":
+        """Parse every URL once, rejecting anything that is not http(s)"""
+        parsed_urls = []
+        for url in self.urls:
+            parsed = urlparse(url)
+            if parsed.scheme not in ("http", "https") or not parsed.netloc:
+                raise ValueError(f"Invalid http(s) URL: {url}")
+            parsed_urls.append((url, parsed))
+        self._parsed_urls = parsed_urls
+        return self
+
+    @property
+    def parsed_urls(self) -> List[Tuple[str, ParseResult]]:
+        """The request URLs paired with their parsed form"""
+        return self._parsed_urls
 
 # Define the response model
 class FragranceData(BaseModel):
@@ -171,150 +375,163 @@ class ScrapeResponse(BaseModel):
     results: List[FragranceData]
     errors: List[Dict[str, str]] = []
 
-async def process_url(url: str, crawler: AsyncWebCrawler) -> Dict[str, Any]:
-    """Process a single URL and return the extracted data"""
+async def process_crawl_result(url: str, parsed: ParseResult, result: Optional[CrawlResult], process_pool: Executor) -> Dict[str, Any]:
+    """
+    Turn the crawl result of a single URL into the extracted data or an error.
+    Large payloads are parsed in process_pool.
+    """
+    if result is None:
+        return {"error": f"No crawl result returned for {url}"}
+
+    if not result.success:
+        logger.error("Failed to crawl %s: %s", url, result.error_message)
+        return {"error": f"Failed to crawl {url}: {result.error_message}"}
+
     try:
-        # Configure the crawler run settings
-        config = CrawlerRunConfig(
-            cache_mode=CacheMode.BYPASS,
-            extraction_strategy=css_strategy,
-            markdown_generator=DefaultMarkdownGenerator(
-                content_filter=PruningContentFilter()
+        # Parse and process the extracted content, moving large payloads off the event loop
+        if len(result.extracted_content) > _OFFLOAD_THRESHOLD:
+            item = await asyncio.get_running_loop().run_in_executor(
+                process_pool, parse_and_clean, result.extracted_content, url, parsed
             )
-        )
+        else:
+            item = parse_and_clean(result.extracted_content, url, parsed)
+    except orjson.JSONDecodeError as e:
+        logger.error("Failed to parse JSON from %s: %s", url, e)
+        return {"error": f"Failed to parse JSON from {url}: {str(e)}"}
+    except Exception as e:
+        return {"error": f"Error processing {url}: {str(e)}"}
 
-        # Run the crawler
-        result = await crawler.arun(url=url, config=config)
+    if item is None:
+        return {"error": f"No data extracted from {url}"}
 
-        if not result.success:
-            error_msg = f"Failed to crawl {url}: {result.error_message}"
-            print(f"Error: {error_msg}")
-            return {"error": error_msg}
+    # Remember the result for the next request
+    _RESULT_CACHE[url] = item
+    return item
 
-        try:
-            # Parse the extracted content
-            data = json.loads(result.extracted_content)
-        except json.JSONDecodeError as e:
-            error_msg = f"Failed to parse JSON from {url}: {str(e)}"
-            print(f"Error: {error_msg}")
-            return {"error": error_msg}
-
-        if not data or len(data) == 0:
-            return {"error": f"No data extracted from {url}"}
-
-        # Process the extracted data
-        item = data[0]
-
-        # Transform the accords from list of objects to list of strings
-        if "accords" in item:
-            item["accords"] = [accord["text"] for accord in item["accords"]]
-
-        # Process notes data
-        notes = {}
-
-        # Check if we have classified notes
-        has_classified_notes = False
-        if "has_top_notes" in item and item["has_top_notes"]:
-            has_classified_notes = True
-        if "has_middle_notes" in item and item["has_middle_notes"]:
-            has_classified_notes = True
-        if "has_base_notes" in item and item["has_base_notes"]:
-            has_classified_notes = True
-
-        # Process top notes
-        if "top_notes" in item:
-            if item["top_notes"]:
-                notes["top"] = item["top_notes"]
-            del item["top_notes"]
-
-        # Process middle notes
-        if "middle_notes" in item:
-            if item["middle_notes"]:
-                notes["middle"] = item["middle_notes"]
-            del item["middle_notes"]
-
-        # Process base notes
-        if "base_notes" in item:
-            if item["base_notes"]:
-                notes["base"] = item["base_notes"]
-            del item["base_notes"]
-
-        # Process unclassified notes if we don't have classified notes
-        if "unclassified_notes" in item:
-            if not has_classified_notes and item["unclassified_notes"]:
-                notes["unclassified"] = item["unclassified_notes"]
-            del item["unclassified_notes"]
-
-        # Clean up the data
-        if "has_top_notes" in item:
-            del item["has_top_notes"]
-        if "has_middle_notes" in item:
-            del item["has_middle_notes"]
-        if "has_base_notes" in item:
-            del item["has_base_notes"]
-
-        # Add the processed notes to the data
-        item["notes"] = notes
-
-        # Extract house and perfume name from URL
-        parsed_url = urlparse(url)
-        path_parts = unquote(parsed_url.path).split('/')
-        if len(path_parts) >= 4 and path_parts[1] == "perfume":
-            # Get house name and replace hyphens with spaces
-            house = path_parts[2].replace('-', ' ')
-
-            # Get perfume name and remove any ID numbers at the end (like -590)
-            perfume_name_raw = path_parts[3].split('.html')[0]
-            # Remove any trailing numbers (like -590) and replace hyphens with spaces
-            perfume_name = ' '.join(perfume_name_raw.split('-')[:-1] if perfume_name_raw.split('-')[-1].isdigit() else perfume_name_raw.split('-'))
-
-            # Add house and perfume name to the data
-            item["house"] = house
-            item["perfume_name"] = perfume_name
-
-            # Clean up the title by removing the "for women and men" or "for men" part
-            if "sex" in item and item["sex"] and "title" in item:
-                item["title"] = item["title"].replace(item["sex"], "")
-
-        return item
+def match_crawl_results(urls: Iterable[str], crawl_results: Iterable[CrawlResult]) -> Dict[str, CrawlResult]:
+    """
+    Map the requested URLs to their crawl results. crawl4ai may report a redirected
+    or normalized URL, so results also match on redirected_url and without trailing slashes.
+    """
+    urls_by_key = {url.rstrip("/"): url for url in urls}
+    results_by_url: Dict[str, CrawlResult] = {}
+    for crawl_result in crawl_results:
+        for reported_url in (crawl_result.url, crawl_result.redirected_url):
+            url = urls_by_key.get((reported_url or "").rstrip("/"))
+            if url is not None and url not in results_by_url:
+                results_by_url[url] = crawl_result
+                break
+        else:
+            logger.warning("Crawl result for %s does not match any requested URL", crawl_result.url)
+    return results_by_url
+
+async def process_url(url: str, parsed: ParseResult, crawler: AsyncWebCrawler, process_pool: Executor, force_refresh: bool = False) -> Dict[str, Any]:
+    """Process a single URL and return the extracted data"""
+    try:
+        # Serve recent results from memory unless a fresh copy was requested
+        if not force_refresh:
+            cached = _RESULT_CACHE.get(url)
+            if cached is not None:
+                return cached
+
+        # Serve the page from the crawl cache unless a fresh copy was requested
+        config = _REFRESH_RUN_CONFIG if force_refresh else _SHARED_RUN_CONFIG
+
+        # Run the crawler
+        async with _CRAWL_SEM:
+            started = time.perf_counter()
+            result = await crawler.arun(url=url, config=config)
+            logger.debug("Crawled %s in %.3fs", url, time.perf_counter() - started)
+
+        return await process_crawl_result(url, parsed, result, process_pool)
     except Exception as e:
         return {"error": f"Error processing {url}: {str(e)}"}
 
-@app.post("/scrape", response_model=ScrapeResponse)
-async def scrape_fragrances(request: ScrapeRequest) -> ScrapeResponse:
+@app.post("/scrape", responses={200: {"model": ScrapeResponse}})
+async def scrape_fragrances(request: ScrapeRequest, http_request: Request) -> ORJSONResponse:
     """
     Scrape fragrance data from the provided URLs
     """
-    # Configure browser settings for Docker environment
-    browser_config = BrowserConfig(
-        headless=True,
-        verbose=False
-    )
-
-    # Note: If you need to pass browser arguments, check the version of crawl4ai
-    # For newer versions, you might use:
-    # browser_config = BrowserConfig(
-    #     headless=True,
-    #     verbose=False,
-    #     browser_args=["--no-sandbox", "--disable-setuid-sandbox", "--disable-dev-shm-usage"]
-    # )
-
     results = []
     errors = []
 
-    # Use context manager for proper resource handling
-    async with AsyncWebCrawler(config=browser_config) as crawler:
-        # Process each URL
-        tasks = [process_url(str(url), crawler) for url in request.urls]
-        processed_results = await asyncio.gather(*tasks)
-
-        for result in processed_results:
-            if "error" in result:
-                errors.append(result)
-            else:
-                results.append(result)
-
-    return ScrapeResponse(results=results, errors=errors)
+    # Serve recent results from memory unless fresh copies were requested
+    processed: Dict[str, Dict[str, Any]] = {}
+    if not request.force_refresh:
+        for url, _ in request.parsed_urls:
+            cached = _RESULT_CACHE.get(url)
+            if cached is not None:
+                processed[url] = cached
+
+    # Crawl the remaining URLs in one batch, each URL only once
+    pending = {url: parsed for url, parsed in request.parsed_urls if url not in processed}
+    if pending:
+        config = _REFRESH_RUN_CONFIG if request.force_refresh else _SHARED_RUN_CONFIG
+
+        # Borrow the shared crawler started in the lifespan handler,
+        # and open no more pages than the shared limit allows
+        async with http_request.app.state.crawler_pool.acquire() as crawler, crawl_slots(len(pending)) as slots:
+            try:
+                started = time.perf_counter()
+                crawl_results = await crawler.arun_many(
+                    urls=list(pending),
+                    config=config,
+                    dispatcher=SemaphoreDispatcher(semaphore_count=slots, max_session_permit=slots)
+                )
+                logger.debug("Crawled %d URLs in %.3fs", len(pending), time.perf_counter() - started)
+            except Exception as e:
+                crawl_results = []
+                for url in pending:
+                    processed[url] = {"error": f"Error processing {url}: {str(e)}"}
+
+        results_by_url = match_crawl_results(pending, crawl_results)
+        crawled = [url for url in pending if url not in processed]
+        items = await asyncio.gather(*[
+            process_crawl_result(url, pending[url], results_by_url.get(url), http_request.app.state.process_pool)
+            for url in crawled
+        ])
+        processed.update(zip(crawled, items))
+
+    # Keep the order of the request
+    for url, _ in request.parsed_urls:
+        result = processed[url]
+        if "error" in result:
+            errors.append(result)
+        else:
+            results.append(result)
+
+    # The results are already in the ScrapeResponse shape, so skip re-validating them
+    return ORJSONResponse({"results": results, "errors": errors})
+
+@app.post("/scrape/stream")
+async def scrape_fragrances_stream(request: ScrapeRequest, http_request: Request) -> StreamingResponse:
+    """
+    Scrape fragrance data from the provided URLs and stream one JSON line per URL as soon as it is done
+    """
+    crawler_pool = http_request.app.state.crawler_pool
+    process_pool = http_request.app.state.process_pool
+
+    async def process_line(url: str, parsed: ParseResult, crawler: AsyncWebCrawler) -> Dict[str, Any]:
+        """Process a URL and tag the outcome with it, since lines arrive in completion order"""
+        return {"url": url, **await process_url(url, parsed, crawler, process_pool, request.force_refresh)}
+
+    async def generate() -> AsyncIterator[bytes]:
+        async with crawler_pool.acquire() as crawler:
+            tasks = [
+                asyncio.ensure_future(process_line(url, parsed, crawler))
+                for url, parsed in request.parsed_urls
+            ]
+            try:
+                for task in asyncio.as_completed(tasks):
+                    yield orjson.dumps(await task) + b"\n"
+            finally:
+                # Stop the remaining crawls if the client went away,
+                # and let them unwind before the crawler is given back
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
 
 @app.get("/")
 async def root():
@@ -324,10 +541,11 @@ async def root():
         "version": "1.0.0",
         "description": "API for scraping fragrance data from Fragrantica",
         "endpoints": {
-            "/scrape": "POST - Scrape fragrance data from provided URLs"
+            "/scrape": "POST - Scrape fragrance data from provided URLs",
+            "/scrape/stream": "POST - Same as /scrape, streamed as newline-delimited JSON"
         }
     }
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("api:app", host="0.0.0.0", port=9000, reload=True)
+    uvicorn.run("api:app", host="0.0.0.0", port=9000, reload=True, loop="uvloop", http="httptools")
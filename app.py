@@ -9,15 +9,158 @@ This example shows how to:
 
 import asyncio
 import os
-import json
-from urllib.parse import urlparse, unquote
+from pathlib import Path
+from typing import Any, Dict, Optional
 
+import orjson
 from crawl4ai import AsyncWebCrawler, BrowserConfig, CrawlerRunConfig, CacheMode
 from crawl4ai import LLMConfig
 from crawl4ai.extraction_strategy import (JsonCssExtractionStrategy)
 from crawl4ai.content_filter_strategy import PruningContentFilter
 from crawl4ai.markdown_generation_strategy import DefaultMarkdownGenerator
 
+from postprocess import postprocess_item
+
+# Define the CSS schema for extraction
+css_schema = {
+    "baseSelector": "body",
+    "fields": [
+        {
+            "name": "title",
+            "selector": "#toptop > h1",
+            "type": "text"
+        },
+        {
+            "name": "sex",
+            "selector": "#toptop > h1 > small",
+            "type": "text"
+        },
+        {
+            "name": "image",
+            "selector": ".text-center .small-12 img",
+            "type": "attribute",
+            "attribute": "src"
+        },
+        {
+            "name": "accords",
+            "selector": ".accord-bar",
+            "type": "list",
+            "fields": [
+                {"name": "text", "type": "text"}
+            ]
+        },
+        {
+            "name": "has_top_notes",
+            "selector": "#pyramid h4:contains('Top Notes')",
+            "type": "exists"
+        },
+        {
+            "name": "has_middle_notes",
+            "selector": "#pyramid h4:contains('Middle Notes')",
+            "type": "exists"
+        },
+        {
+            "name": "has_base_notes",
+            "selector": "#pyramid h4:contains('Base Notes')",
+            "type": "exists"
+        },
+        {
+            "name": "top_notes",
+            "selector": "#pyramid h4:contains('Top Notes') + div div[style*='justify-content: center'] > div:has(div:nth-child(2))",
+            "type": "nested_list",
+            "fields": [
+                {
+                    "name": "name",
+                    "selector": "div:nth-child(2)",
+                    "type": "text"
+                },
+                {
+                    "name": "image",
+                    "selector": "img",
+                    "type": "attribute",
+                    "attribute": "src"
+                }
+            ]
+        },
+        {
+            "name": "middle_notes",
+            "selector": "#pyramid h4:contains('Middle Notes') + div div[style*='justify-content: center'] > div:has(div:nth-child(2))",
+            "type": "nested_list",
+            "fields": [
+                {
+                    "name": "name",
+                    "selector": "div:nth-child(2)",
+                    "type": "text"
+                },
+                {
+                    "name": "image",
+                    "selector": "img",
+                    "type": "attribute",
+                    "attribute": "src"
+                }
+            ]
+        },
+        {
+            "name": "base_notes",
+            "selector": "#pyramid h4:contains('Base Notes') + div div[style*='justify-content: center'] > div:has(div:nth-child(2))",
+            "type": "nested_list",
+            "fields": [
+                {
+                    "name": "name",
+                    "selector": "div:nth-child(2)",
+                    "type": "text"
+                },
+                {
+                    "name": "image",
+                    "selector": "img",
+                    "type": "attribute",
+                    "attribute": "src"
+                }
+            ]
+        },
+        {
+            "name": "unclassified_notes",
+            "selector": "#pyramid .notes-box + div div[style*='justify-content: center'] > div:has(div:nth-child(2))",
+            "type": "nested_list",
+            "fields": [
+                {
+                    "name": "name",
+                    "selector": "div:nth-child(2)",
+                    "type": "text"
+                },
+                {
+                    "name": "image",
+                    "selector": "img",
+                    "type": "attribute",
+                    "attribute": "src"
+                }
+            ]
+        }
+    ],
+}
+
+# Create the extraction strategy
+css_strategy = JsonCssExtractionStrategy(schema=css_schema)
+
+# Configure browser settings
+browser_options = {
+    "headless": True,
+    "verbose": os.getenv("VERBOSE", "true").lower() == "true",
+    "extra_args": ["--no-sandbox", "--disable-dev-shm-usage", "--disable-gpu"],
+}
+
+# Skip ads and stylesheets, the CSS schema does not need them
+if os.getenv("FRAGCRAWL_BLOCK_RESOURCES", "true").lower() == "true":
+    browser_options.update(avoid_ads=True, avoid_css=True)
+
+browser_config = BrowserConfig(**browser_options)
+
+# Crawler run settings shared by every extraction
+_SHARED_RUN_CONFIG = CrawlerRunConfig(
+    cache_mode=CacheMode.BYPASS,
+    extraction_strategy=css_strategy
+)
+
 
 async def run_extraction(crawler: AsyncWebCrawler, url: str, strategy, name: str):
     """Helper function to run extraction with proper configuration"""
@@ -35,86 +178,15 @@ async def run_extraction(crawler: AsyncWebCrawler, url: str, strategy, name: str
         result = await crawler.arun(url=url, config=config)
 
         if result.success:
-            import json
-            from urllib.parse import urlparse, unquote
-
             # Parse the extracted content
-            data = json.loads(result.extracted_content)
+            data = orjson.loads(result.extracted_content)
 
             if data and len(data) > 0:
-                # Transform the accords from list of objects to list of strings
-                if "accords" in data[0]:
-                    data[0]["accords"] = [item["text"] for item in data[0]["accords"]]
-
-                # Process notes data
-                notes = {}
-
-                # Check if we have classified notes
-                has_classified_notes = False
-                if "has_top_notes" in data[0] and data[0]["has_top_notes"]:
-                    has_classified_notes = True
-                if "has_middle_notes" in data[0] and data[0]["has_middle_notes"]:
-                    has_classified_notes = True
-                if "has_base_notes" in data[0] and data[0]["has_base_notes"]:
-                    has_classified_notes = True
-
-                # Process top notes
-                if "top_notes" in data[0]:
-                    if data[0]["top_notes"]:
-                        notes["top"] = data[0]["top_notes"]
-                    del data[0]["top_notes"]
-
-                # Process middle notes
-                if "middle_notes" in data[0]:
-                    if data[0]["middle_notes"]:
-                        notes["middle"] = data[0]["middle_notes"]
-                    del data[0]["middle_notes"]
-
-                # Process base notes
-                if "base_notes" in data[0]:
-                    if data[0]["base_notes"]:
-                        notes["base"] = data[0]["base_notes"]
-                    del data[0]["base_notes"]
-
-                # Process unclassified notes if we don't have classified notes
-                if "unclassified_notes" in data[0]:
-                    if not has_classified_notes and data[0]["unclassified_notes"]:
-                        notes["unclassified"] = data[0]["unclassified_notes"]
-                    del data[0]["unclassified_notes"]
-
-                # Clean up the data
-                if "has_top_notes" in data[0]:
-                    del data[0]["has_top_notes"]
-                if "has_middle_notes" in data[0]:
-                    del data[0]["has_middle_notes"]
-                if "has_base_notes" in data[0]:
-                    del data[0]["has_base_notes"]
-
-                # Add the processed notes to the data
-                data[0]["notes"] = notes
-
-                # Extract house and perfume name from URL
-                parsed_url = urlparse(url)
-                path_parts = unquote(parsed_url.path).split('/')
-                if len(path_parts) >= 4 and path_parts[1] == "perfume":
-                    # Get house name and replace hyphens with spaces
-                    house = path_parts[2].replace('-', ' ')
-
-                    # Get perfume name and remove any ID numbers at the end (like -590)
-                    perfume_name_raw = path_parts[3].split('.html')[0]
-                    # Remove any trailing numbers (like -590) and replace hyphens with spaces
-                    perfume_name = ' '.join(perfume_name_raw.split('-')[:-1] if perfume_name_raw.split('-')[-1].isdigit() else perfume_name_raw.split('-'))
-
-                    # Add house and perfume name to the data
-                    data[0]["house"] = house
-                    data[0]["perfume_name"] = perfume_name
-
-                    # Clean up the title by removing the "for women and men" or "for men" part
-                    if "sex" in data[0] and data[0]["sex"] and "title" in data[0]:
-                        data[0]["title"] = data[0]["title"].replace(data[0]["sex"], "")
+                # Process the data
+                postprocess_item(data[0], url)
 
             print(f"\n=== {name} Results ===")
-            print(f"Extracted Content: {json.dumps(data, indent=4)}")
+            print(f"Extracted Content: {orjson.dumps(data, option=orjson.OPT_INDENT_2).decode()}")
             print(f"Raw Markdown Length: {len(result.markdown.raw_markdown)}")
             print(
                 f"Citations Markdown Length: {len(result.markdown.markdown_with_citations)}"
@@ -126,241 +198,50 @@ async def run_extraction(crawler: AsyncWebCrawler, url: str, strategy, name: str
         print(f"Error in {name}: {str(e)}")
 
 
+async def scrape(url: str, crawler: Optional[AsyncWebCrawler] = None) -> Dict[str, Any]:
+    """
+    Scrape a single fragrance page and return the extracted data, or a dict with an error.
+    Pass a running crawler to reuse its browser, otherwise one is started for this call.
+    """
+    if crawler is None:
+        # Use context manager for proper resource handling
+        async with AsyncWebCrawler(config=browser_config) as crawler:
+            return await scrape(url, crawler)
+
+    # Run the crawler
+    result = await crawler.arun(url=url, config=_SHARED_RUN_CONFIG)
+
+    if not result.success:
+        return {"error": f"Failed to scrape {url}: {result.error_message}"}
+
+    # Parse the extracted content
+    data = orjson.loads(result.extracted_content)
+
+    if not data or len(data) == 0:
+        return {"error": f"No data extracted from {url}"}
+
+    # Process the data
+    return postprocess_item(data[0], url)
+
 async def extract_fragrance_data(url, output_file=None):
     """Extract fragrance data from a URL and optionally save to a file"""
-    # Configure browser settings
-    browser_config = BrowserConfig(headless=True, verbose=True)
-
-    # Initialize CSS extraction strategy
-    css_schema = {
-        "baseSelector": "body",
-        "fields": [
-            {
-                "name": "title",
-                "selector": "#toptop > h1",
-                "type": "text"
-            },
-            {
-                "name": "sex",
-                "selector": "#toptop > h1 > small",
-                "type": "text"
-            },
-            {
-                "name": "image",
-                "selector": ".text-center .small-12 img",
-                "type": "attribute",
-                "attribute": "src"
-            },
-            {
-                "name": "accords",
-                "selector": ".accord-bar",
-                "type": "list",
-                "fields": [
-                    {"name": "text", "type": "text"}
-                ]
-            },
-            {
-                "name": "has_top_notes",
-                "selector": "#pyramid h4:contains('Top Notes')",
-                "type": "exists"
-            },
-            {
-                "name": "has_middle_notes",
-                "selector": "#pyramid h4:contains('Middle Notes')",
-                "type": "exists"
-            },
-            {
-                "name": "has_base_notes",
-                "selector": "#pyramid h4:contains('Base Notes')",
-                "type": "exists"
-            },
-            {
-                "name": "top_notes",
-                "selector": "#pyramid h4:contains('Top Notes') + div div[style*='justify-content: center'] > div:has(div:nth-child(2))",
-                "type": "nested_list",
-                "fields": [
-                    {
-                        "name": "name",
-                        "selector": "div:nth-child(2)",
-                        "type": "text"
-                    },
-                    {
-                        "name": "image",
-                        "selector": "img",
-                        "type": "attribute",
-                        "attribute": "src"
-                    }
-                ]
-            },
-            {
-                "name": "middle_notes",
-                "selector": "#pyramid h4:contains('Middle Notes') + div div[style*='justify-content: center'] > div:has(div:nth-child(2))",
-                "type": "nested_list",
-                "fields": [
-                    {
-                        "name": "name",
-                        "selector": "div:nth-child(2)",
-                        "type": "text"
-                    },
-                    {
-                        "name": "image",
-                        "selector": "img",
-                        "type": "attribute",
-                        "attribute": "src"
-                    }
-                ]
-            },
-            {
-                "name": "base_notes",
-                "selector": "#pyramid h4:contains('Base Notes') + div div[style*='justify-content: center'] > div:has(div:nth-child(2))",
-                "type": "nested_list",
-                "fields": [
-                    {
-                        "name": "name",
-                        "selector": "div:nth-child(2)",
-                        "type": "text"
-                    },
-                    {
-                        "name": "image",
-                        "selector": "img",
-                        "type": "attribute",
-                        "attribute": "src"
-                    }
-                ]
-            },
-            {
-                "name": "unclassified_notes",
-                "selector": "#pyramid .notes-box + div div[style*='justify-content: center'] > div:has(div:nth-child(2))",
-                "type": "nested_list",
-                "fields": [
-                    {
-                        "name": "name",
-                        "selector": "div:nth-child(2)",
-                        "type": "text"
-                    },
-                    {
-                        "name": "image",
-                        "selector": "img",
-                        "type": "attribute",
-                        "attribute": "src"
-                    }
-                ]
-            }
-        ],
-    }
-    css_strategy = JsonCssExtractionStrategy(schema=css_schema)
-
-    # Use context manager for proper resource handling
-    result_data = None
-    async with AsyncWebCrawler(config=browser_config) as crawler:
-        # Configure the crawler run settings
-        config = CrawlerRunConfig(
-            cache_mode=CacheMode.BYPASS,
-            extraction_strategy=css_strategy,
-            markdown_generator=DefaultMarkdownGenerator(
-                content_filter=PruningContentFilter()
-            )
-        )
+    item = await scrape(url)
 
-        # Run the crawler
-        result = await crawler.arun(url=url, config=config)
+    if "error" in item:
+        print(f"Error: {item['error']}")
+        return None
 
-        if result.success:
-            # Parse the extracted content
-            data = json.loads(result.extracted_content)
+    # Print the result
+    print(f"\n=== Extraction Results ===")
+    print(f"Extracted Content: {orjson.dumps(item, option=orjson.OPT_INDENT_2).decode()}")
 
-            if data and len(data) > 0:
-                # Process the data
-                item = data[0]
-
-                # Transform the accords from list of objects to list of strings
-                if "accords" in item:
-                    item["accords"] = [accord["text"] for accord in item["accords"]]
-
-                # Process notes data
-                notes = {}
-
-                # Check if we have classified notes
-                has_classified_notes = False
-                if "has_top_notes" in item and item["has_top_notes"]:
-                    has_classified_notes = True
-                if "has_middle_notes" in item and item["has_middle_notes"]:
-                    has_classified_notes = True
-                if "has_base_notes" in item and item["has_base_notes"]:
-                    has_classified_notes = True
-
-                # Process top notes
-                if "top_notes" in item:
-                    if item["top_notes"]:
-                        notes["top"] = item["top_notes"]
-                    del item["top_notes"]
-
-                # Process middle notes
-                if "middle_notes" in item:
-                    if item["middle_notes"]:
-                        notes["middle"] = item["middle_notes"]
-                    del item["middle_notes"]
-
-                # Process base notes
-                if "base_notes" in item:
-                    if item["base_notes"]:
-                        notes["base"] = item["base_notes"]
-                    del item["base_notes"]
-
-                # Process unclassified notes if we don't have classified notes
-                if "unclassified_notes" in item:
-                    if not has_classified_notes and item["unclassified_notes"]:
-                        notes["unclassified"] = item["unclassified_notes"]
-                    del item["unclassified_notes"]
-
-                # Clean up the data
-                if "has_top_notes" in item:
-                    del item["has_top_notes"]
-                if "has_middle_notes" in item:
-                    del item["has_middle_notes"]
-                if "has_base_notes" in item:
-                    del item["has_base_notes"]
-
-                # Add the processed notes to the data
-                item["notes"] = notes
-
-                # Extract house and perfume name from URL
-                parsed_url = urlparse(url)
-                path_parts = unquote(parsed_url.path).split('/')
-                if len(path_parts) >= 4 and path_parts[1] == "perfume":
-                    # Get house name and replace hyphens with spaces
-                    house = path_parts[2].replace('-', ' ')
-
-                    # Get perfume name and remove any ID numbers at the end (like -590)
-                    perfume_name_raw = path_parts[3].split('.html')[0]
-                    # Remove any trailing numbers (like -590) and replace hyphens with spaces
-                    perfume_name = ' '.join(perfume_name_raw.split('-')[:-1] if perfume_name_raw.split('-')[-1].isdigit() else perfume_name_raw.split('-'))
-
-                    # Add house and perfume name to the data
-                    item["house"] = house
-                    item["perfume_name"] = perfume_name
-
-                    # Clean up the title by removing the "for women and men" or "for men" part
-                    if "sex" in item and item["sex"] and "title" in item:
-                        item["title"] = item["title"].replace(item["sex"], "")
-
-                # Save the result
-                result_data = item
-
-                # Print the result
-                print(f"\n=== Extraction Results ===")
-                print(f"Extracted Content: {json.dumps(item, indent=4)}")
-
-                # Save to file if specified
-                if output_file:
-                    with open(output_file, 'w') as f:
-                        json.dump(item, f, indent=4)
-            else:
-                print(f"Error: No data extracted")
-        else:
-            print(f"Error: Crawl failed - {result.error_message}")
+    # Save to file if specified, without blocking the event loop
+    if output_file:
+        await asyncio.get_running_loop().run_in_executor(
+            None, Path(output_file).write_bytes, orjson.dumps(item, option=orjson.OPT_INDENT_2)
+        )
 
-    return result_data
+    return item
 
 async def main():
     """Main function that parses command line arguments and runs the extraction"""
@@ -22,7 +22,7 @@ async def crawl(request: CrawlRequest):
     async with AsyncWebCrawler(config=browser_config) as crawler:
         strategy = JsonCssExtractionStrategy(schema=request.css_schema)
         config = CrawlerRunConfig(
-            cache_mode=CacheMode.USE_CACHE,  # Use cache to save resources
+            cache_mode=CacheMode.ENABLED,  # Use cache to save resources
             extraction_strategy=strategy
         )
         
@@ -0,0 +1,75 @@
+"""
+Post-processing of the items extracted with the fragrance CSS schema.
+Shared by the API and the command line scraper.
+"""
+
+import re
+from typing import Any, Dict, Optional
+from urllib.parse import ParseResult, urlparse, unquote
+
+import orjson
+
+# Matches /perfume/<house>/<slug>, where the slug is usually <name>-<id>.html
+_PERFUME_URL_RE = re.compile(r"^/perfume/(?P<house>[^/]*)/(?P<slug>[^/]*)")
+
+# Note positions of the pyramid, in display order
+_NOTE_POSITIONS = ("top", "middle", "base")
+
+
+def postprocess_item(item: Dict[str, Any], url: str, parsed: Optional[ParseResult] = None) -> Dict[str, Any]:
+    """
+    Clean up a raw extracted item in place and return it.
+    Pass parsed when the caller has already run urlparse on url.
+    """
+    # Transform the accords from list of objects to list of strings
+    if "accords" in item:
+        item["accords"] = [accord["text"] for accord in item["accords"]]
+
+    # Check if we have classified notes (the list makes sure every flag is removed)
+    has_classified_notes = any([item.pop(f"has_{key}_notes", False) for key in _NOTE_POSITIONS])
+
+    # Move the non-empty top, middle and base notes under notes
+    classified_notes = {key: item.pop(f"{key}_notes", None) for key in _NOTE_POSITIONS}
+    notes = {key: value for key, value in classified_notes.items() if value}
+
+    # Process unclassified notes if we don't have classified notes
+    unclassified_notes = item.pop("unclassified_notes", None)
+    if unclassified_notes and not has_classified_notes:
+        notes["unclassified"] = unclassified_notes
+
+    # Add the processed notes to the data
+    item["notes"] = notes
+
+    # Extract house and perfume name from URL
+    if parsed is None:
+        parsed = urlparse(url)
+    match = _PERFUME_URL_RE.match(unquote(parsed.path))
+    if match:
+        # Drop the .html extension and the trailing ID (like -590), if any
+        slug = match["slug"].partition(".html")[0]
+        name, _, perfume_id = slug.rpartition("-")
+        if not perfume_id.isdigit():
+            name = slug
+
+        # Replace hyphens with spaces in the house and perfume names
+        item["house"] = match["house"].replace('-', ' ')
+        item["perfume_name"] = name.replace('-', ' ')
+
+        # Clean up the title by removing the "for women and men" or "for men" suffix
+        title = item.get("title") or ""
+        sex = item.get("sex") or ""
+        if sex and title.endswith(sex):
+            item["title"] = title[:-len(sex)].rstrip()
+
+    return item
+
+
+def parse_and_clean(extracted_content: str, url: str, parsed: Optional[ParseResult] = None) -> Optional[Dict[str, Any]]:
+    """
+    Parse the JSON extracted with the CSS schema and clean up its first item.
+    Returns None when nothing was extracted. Has no side effects, so it can run in a worker process.
+    """
+    data = orjson.loads(extracted_content)
+    if not data:
+        return None
+    return postprocess_item(data[0], url, parsed)
@@ -1,35 +1,110 @@
 """
-Simple FastAPI application for fragrance scraping using subprocess to run the scraper.
+Simple FastAPI application for fragrance scraping using the scraper from app.py.
 This API allows users to send URLs of fragrance pages and receive structured JSON data.
 """
 
-import json
-import subprocess
-import tempfile
-from typing import List, Dict, Any, Optional
-from fastapi import FastAPI, HTTPException
+import asyncio
+import logging
+import os
+import uuid
+import weakref
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, HttpUrl
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, field_validator
+
+import orjson
+from cachetools import TTLCache
+from crawl4ai import AsyncWebCrawler, BrowserConfig
+
+from app import browser_options, scrape
+
+logger = logging.getLogger("fragcrawl")
+
+# Same browser as the command line scraper, but without crawl4ai's progress output on the API's stdout
+browser_config = BrowserConfig(**{**browser_options, "verbose": False})
+
+# Limit the number of pages open in the shared browser at the same time
+_SCRAPE_SEM = asyncio.Semaphore(int(os.getenv("FRAGCRAWL_CONCURRENCY", "10")))
+
+# Number of uvicorn worker processes. Each one runs its own browser with its own
+# FRAGCRAWL_CONCURRENCY pages, result cache and URL locks, so keep it at 1 unless
+# the host has memory for that many browsers. uvicorn reads the same variable.
+WORKERS = int(os.getenv("WEB_CONCURRENCY", "1"))
+
+# Largest number of URLs accepted in one request
+MAX_URLS = int(os.getenv("FRAGCRAWL_MAX_URLS", "100"))
+
+# Scraped results of recent URLs, keyed by the URL string
+_RESULT_CACHE: TTLCache = TTLCache(
+    maxsize=int(os.getenv("FRAGCRAWL_RESULT_CACHE_SIZE", "1024")),
+    ttl=int(os.getenv("FRAGCRAWL_RESULT_CACHE_TTL", "3600"))
+)
+
+# One lock per URL being scraped, so concurrent requests for it share a single scrape
+_URL_LOCKS: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+# Background scrape jobs by job ID. The TTL restarts when a job starts and when it
+# finishes, so results are kept for a while after they are ready.
+# They live in the memory of one worker, so they are only offered with a single worker.
+JOBS_ENABLED = WORKERS == 1
+_JOBS: TTLCache = TTLCache(maxsize=10_000, ttl=int(os.getenv("FRAGCRAWL_JOB_TTL", "3600")))
+
+# Largest number of jobs waiting to run, so they cannot pile up past their TTL
+_JOB_QUEUE_SIZE = int(os.getenv("FRAGCRAWL_JOB_QUEUE_SIZE", "100"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start the shared browser and job runner on startup and stop them on shutdown"""
+    async with AsyncWebCrawler(config=browser_config) as crawler:
+        app.state.crawler = crawler
+        app.state.job_queue = asyncio.Queue(maxsize=_JOB_QUEUE_SIZE)
+        job_runner = None
+        if JOBS_ENABLED:
+            job_runner = asyncio.create_task(run_jobs(app.state.job_queue, crawler))
+        else:
+            logger.warning("Background jobs are disabled with %d workers (WEB_CONCURRENCY)", WORKERS)
+        try:
+            yield
+        finally:
+            # Let the runner unwind before the browser is closed
+            if job_runner is not None:
+                job_runner.cancel()
+                await asyncio.gather(job_runner, return_exceptions=True)
 
 # Create the FastAPI app
 app = FastAPI(
     title="Fragrance Scraper API",
     description="API for scraping fragrance data from Fragrantica",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # Allow all origins
-    allow_credentials=True,
-    allow_methods=["*"],  # Allow all methods
-    allow_headers=["*"],  # Allow all headers
+    allow_origins=[origin.strip() for origin in os.getenv("CORS_ORIGINS", "*").split(",") if origin.strip()],  # Comma-separated, all origins by default
+    allow_credentials=False,  # The API does not use cookies
+    allow_methods=["GET", "POST"],
+    allow_headers=["Content-Type"],
 )
 
 # Define the request model
 class ScrapeRequest(BaseModel):
-    urls: List[HttpUrl]
+    urls: List[str]
+    force_refresh: bool = False
+
+    @field_validator("urls")
+    @classmethod
+    def check_urls(cls, urls: List[str]) -> List[str]:
+        """Cheaply reject anything that is not an http(s) URL"""
+        for url in urls:
+            if not url.startswith(("http://", "https://")):
+                raise ValueError(f"Invalid http(s) URL: {url}")
+        return urls
 
 # Define the response model
 class FragranceData(BaseModel):
@@ -45,59 +120,157 @@ class ScrapeResponse(BaseModel):
     results: List[FragranceData]
     errors: List[Dict[str, str]] = []
 
-def run_scraper(url: str) -> Dict[str, Any]:
-    """Run the scraper for a single URL using subprocess"""
-    try:
-        # Create a temporary file to store the output
-        with tempfile.NamedTemporaryFile(mode='w+', delete=False, suffix='.json') as temp_file:
-            temp_file_path = temp_file.name
-        
-        # Run the scraper and save the output to the temporary file
-        cmd = [
-            "python", 
-            "app.py", 
-            "--url", 
-            url,
-            "--output",
-            temp_file_path
-        ]
-        
-        # Run the command
-        process = subprocess.run(
-            cmd, 
-            capture_output=True, 
-            text=True, 
-            check=True
+def check_batch_size(request: ScrapeRequest) -> None:
+    """Reject requests with more than MAX_URLS URLs"""
+    if len(request.urls) > MAX_URLS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many URLs: {len(request.urls)} (at most {MAX_URLS} per request)"
         )
-        
-        # Read the output from the temporary file
-        with open(temp_file_path, 'r') as f:
-            result = json.load(f)
-        
+
+async def run_scraper(url: str, crawler: AsyncWebCrawler, force_refresh: bool = False) -> Dict[str, Any]:
+    """Run the scraper for a single URL in the shared browser, reusing recent results unless force_refresh is set"""
+    cached = None if force_refresh else _RESULT_CACHE.get(url)
+    if cached is not None:
+        return cached
+
+    lock = _URL_LOCKS.get(url)
+    if lock is None:
+        lock = _URL_LOCKS[url] = asyncio.Lock()
+
+    async with lock:
+        # Another request may have scraped the URL while we were waiting
+        cached = None if force_refresh else _RESULT_CACHE.get(url)
+        if cached is not None:
+            return cached
+
+        try:
+            async with _SCRAPE_SEM:
+                result = await scrape(url, crawler)
+        except Exception as e:
+            return {"error": f"Error processing {url}: {str(e)}"}
+
+        if "error" not in result:
+            _RESULT_CACHE[url] = result
         return result
-    except subprocess.CalledProcessError as e:
-        return {"error": f"Failed to scrape {url}: {e.stderr}"}
-    except Exception as e:
-        return {"error": f"Error processing {url}: {str(e)}"}
 
-@app.post("/scrape", response_model=ScrapeResponse)
-async def scrape_fragrances(request: ScrapeRequest) -> ScrapeResponse:
-    """
-    Scrape fragrance data from the provided URLs
-    """
+async def scrape_batch(urls: List[str], crawler: AsyncWebCrawler, force_refresh: bool = False) -> Tuple[List[Dict[str, Any]], List[Dict[str, str]]]:
+    """Scrape a list of URLs and split the outcomes into results and errors"""
     results = []
     errors = []
-    
-    # Process each URL
-    for url in request.urls:
-        result = run_scraper(str(url))
-        
-        if "error" in result:
+
+    # Process each distinct URL once, all of them concurrently
+    unique_urls = list(dict.fromkeys(urls))
+    processed_results = await asyncio.gather(
+        *[run_scraper(url, crawler, force_refresh) for url in unique_urls],
+        return_exceptions=True
+    )
+    results_by_url = dict(zip(unique_urls, processed_results))
+
+    # Report the results in the order of the request, duplicates included
+    for url in urls:
+        result = results_by_url[url]
+        if isinstance(result, BaseException):
+            errors.append({"error": f"Error processing {url}: {str(result)}"})
+        elif "error" in result:
             errors.append(result)
         else:
             results.append(result)
-    
-    return ScrapeResponse(results=results, errors=errors)
+
+    return results, errors
+
+async def run_jobs(job_queue: asyncio.Queue, crawler: AsyncWebCrawler) -> None:
+    """Scrape queued jobs one after the other, storing their results in _JOBS"""
+    while True:
+        job_id, urls, force_refresh = await job_queue.get()
+        job = _JOBS.get(job_id)
+        if job is None:
+            # The job expired before it could run
+            continue
+
+        # Store the job again on every change to restart its TTL
+        job["status"] = "running"
+        _JOBS[job_id] = job
+        try:
+            results, errors = await scrape_batch(urls, crawler, force_refresh)
+        except Exception as e:
+            # Keep the runner alive for the jobs queued after this one
+            logger.exception("Background job %s failed", job_id)
+            job.update(status="failed", errors=[{"error": f"Job failed: {str(e)}"}])
+        else:
+            job.update(status="done", results=results, errors=errors)
+        _JOBS[job_id] = job
+
+@app.post("/scrape", responses={200: {"model": ScrapeResponse}})
+async def scrape_fragrances(request: ScrapeRequest, http_request: Request) -> ORJSONResponse:
+    """
+    Scrape fragrance data from the provided URLs
+    """
+    check_batch_size(request)
+
+    results, errors = await scrape_batch(request.urls, http_request.app.state.crawler, request.force_refresh)
+
+    # The results are already in the ScrapeResponse shape, so skip re-validating them
+    return ORJSONResponse({"results": results, "errors": errors})
+
+@app.post("/scrape/stream")
+async def scrape_fragrances_stream(request: ScrapeRequest, http_request: Request) -> StreamingResponse:
+    """
+    Scrape fragrance data from the provided URLs and stream one JSON line per URL as soon as it is done
+    """
+    check_batch_size(request)
+
+    crawler = http_request.app.state.crawler
+
+    async def scrape_line(url: str) -> Dict[str, Any]:
+        """Scrape a URL and tag the outcome with it, since lines arrive in completion order"""
+        return {"url": url, **await run_scraper(url, crawler, request.force_refresh)}
+
+    async def generate() -> AsyncIterator[bytes]:
+        tasks = [asyncio.ensure_future(scrape_line(url)) for url in request.urls]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield orjson.dumps(await task) + b"\n"
+        finally:
+            # Stop the remaining scrapes if the client went away, and let them unwind
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+@app.post("/scrape/jobs", status_code=202)
+async def create_scrape_job(request: ScrapeRequest, http_request: Request) -> Dict[str, str]:
+    """
+    Queue the provided URLs for scraping in the background and return the job ID to poll
+    """
+    if not JOBS_ENABLED:
+        raise HTTPException(
+            status_code=503,
+            detail="Background jobs need a single worker process (WEB_CONCURRENCY=1)"
+        )
+
+    check_batch_size(request)
+
+    job_id = uuid.uuid4().hex
+    try:
+        http_request.app.state.job_queue.put_nowait((job_id, request.urls, request.force_refresh))
+    except asyncio.QueueFull:
+        raise HTTPException(status_code=503, detail="Too many queued jobs, try again later")
+    _JOBS[job_id] = {"status": "queued", "results": [], "errors": []}
+
+    return {"job_id": job_id}
+
+@app.get("/scrape/jobs/{job_id}")
+async def get_scrape_job(job_id: str) -> Dict[str, Any]:
+    """
+    Return the status of a background scrape job, with its results once it is done
+    """
+    job = _JOBS.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired job: {job_id}")
+
+    return {"job_id": job_id, **job}
 
 @app.get("/")
 async def root():
@@ -107,10 +280,26 @@ async def root():
         "version": "1.0.0",
         "description": "API for scraping fragrance data from Fragrantica",
         "endpoints": {
-            "/scrape": "POST - Scrape fragrance data from provided URLs"
+            "/scrape": "POST - Scrape fragrance data from provided URLs",
+            "/scrape/stream": "POST - Same as /scrape, streamed as newline-delimited JSON",
+            "/scrape/jobs": "POST - Queue URLs for scraping in the background and return a job ID",
+            "/scrape/jobs/{job_id}": "GET - Status and results of a background scrape job"
         }
     }
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("simple_api:app", host="0.0.0.0", port=9000, reload=True)
+
+    if os.getenv("API_RELOAD", "false").lower() == "true":
+        # Development: a single worker that restarts when the code changes
+        uvicorn.run("simple_api:app", host="0.0.0.0", port=9000, reload=True, loop="uvloop", http="httptools")
+    else:
+        # Same worker count as the Docker image, set with WEB_CONCURRENCY
+        uvicorn.run(
+            "simple_api:app",
+            host="0.0.0.0",
+            port=9000,
+            workers=WORKERS,
+            loop="uvloop",
+            http="httptools"
+        )
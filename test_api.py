@@ -1,17 +1,45 @@
 """
 Test script for the Fragrance Scraper API.
-This script sends a request to the API and prints the response.
+This script sends a request to the streaming endpoint and prints each result as it arrives.
 """
 
 import requests
 import json
 import sys
 
+def print_fragrance(index, result):
+    """Print one extracted fragrance in a readable format"""
+    print(f"\n--- Fragrance {index} ---")
+    print(f"URL: {result.get('url', 'N/A')}")
+    print(f"Title: {result.get('title', 'N/A')}")
+    print(f"House: {result.get('house', 'N/A')}")
+    print(f"Perfume Name: {result.get('perfume_name', 'N/A')}")
+    print(f"Sex: {result.get('sex', 'N/A')}")
+    print(f"Image: {result.get('image', 'N/A')}")
+
+    # Print accords
+    if 'accords' in result and result['accords']:
+        print(f"Accords: {', '.join(result['accords'])}")
+    else:
+        print("Accords: None")
+
+    # Print notes
+    if 'notes' in result and result['notes']:
+        print("\nNotes:")
+        for category, notes in result['notes'].items():
+            print(f"  {category.capitalize()} Notes:")
+            for note in notes:
+                note_name = note.get('name', 'N/A')
+                note_image = note.get('image', 'N/A')
+                print(f"    - {note_name} (Image: {note_image})")
+    else:
+        print("\nNotes: None")
+
 def test_api(urls):
-    """Test the API by sending a request with the provided URLs"""
+    """Test the API by streaming the results for the provided URLs"""
     try:
         # API endpoint
-        api_url = "http://localhost:9000/scrape"
+        api_url = "http://localhost:9000/scrape/stream"
 
         # Request payload
         payload = {
@@ -20,59 +48,40 @@ def test_api(urls):
 
         print(f"Sending request to {api_url} with {len(urls)} URLs...")
 
-        # Send the request
-        response = requests.post(api_url, json=payload)
-
-        # Check if the request was successful
-        if response.status_code == 200:
-            # Parse the response
-            data = response.json()
-
-            # Print the raw JSON response
-            print("\nRaw JSON Response:")
-            print(json.dumps(data, indent=2))
-
-            # Print the results
-            print("\nAPI Response:")
-            print(f"Results: {len(data['results'])}")
-            print(f"Errors: {len(data['errors'])}")
-
-            # Print the results in a formatted way
-            print("\nExtracted Fragrances:")
-            for i, result in enumerate(data['results']):
-                print(f"\n--- Fragrance {i+1} ---")
-                print(f"Title: {result.get('title', 'N/A')}")
-                print(f"House: {result.get('house', 'N/A')}")
-                print(f"Perfume Name: {result.get('perfume_name', 'N/A')}")
-                print(f"Sex: {result.get('sex', 'N/A')}")
-                print(f"Image: {result.get('image', 'N/A')}")
-
-                # Print accords
-                if 'accords' in result and result['accords']:
-                    print(f"Accords: {', '.join(result['accords'])}")
-                else:
-                    print("Accords: None")
-
-                # Print notes
-                if 'notes' in result and result['notes']:
-                    print("\nNotes:")
-                    for category, notes in result['notes'].items():
-                        print(f"  {category.capitalize()} Notes:")
-                        for note in notes:
-                            note_name = note.get('name', 'N/A')
-                            note_image = note.get('image', 'N/A')
-                            print(f"    - {note_name} (Image: {note_image})")
-                else:
-                    print("\nNotes: None")
-
-            # Print any errors
-            if data['errors']:
-                print("\nErrors:")
-                for error in data['errors']:
-                    print(f"- {error}")
-        else:
-            print(f"Error: API returned status code {response.status_code}")
-            print(f"Response: {response.text}")
+        # Send the request and read the response line by line
+        with requests.Session() as session:
+            with session.post(api_url, json=payload, stream=True) as response:
+                # Check if the request was successful
+                if response.status_code != 200:
+                    print(f"Error: API returned status code {response.status_code}")
+                    print(f"Response: {response.text}")
+                    return
+
+                # Print each fragrance as soon as it arrives
+                print("\nExtracted Fragrances:")
+                results = 0
+                errors = []
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+
+                    result = json.loads(line)
+                    if "error" in result:
+                        errors.append(result)
+                    else:
+                        results += 1
+                        print_fragrance(results, result)
+
+        # Print the summary
+        print("\nAPI Response:")
+        print(f"Results: {results}")
+        print(f"Errors: {len(errors)}")
+
+        # Print any errors
+        if errors:
+            print("\nErrors:")
+            for error in errors:
+                print(f"- {error}")
 
     except requests.exceptions.ConnectionError:
         print("Error: Could not connect to the API. Make sure the API server is running.")